@@ -1,23 +1,34 @@
 #!/usr/bin/env python
 """
 Do some batch processing, converting h5 -> hitmap
+
+Usage: ./batch.py <h5list> [<processes>]
+
+The h5 files are scanned by a pool of worker processes, each of which saves its own hitmaps. Every scan uses the GPU,
+so the default is a single worker; raise it when there is GPU memory to spare.
 """
 
-import os
+import multiprocessing
 import random
 import sys
 
 import hit_map
 import scanner
 
+
 assert __name__ == "__main__"
 input_filename = sys.argv[1]
+if len(sys.argv) >= 3:
+    processes = int(sys.argv[2])
+else:
+    processes = 1
 
 h5_filenames = [line.strip() for line in open(input_filename)]
 random.shuffle(h5_filenames)
+existing = hit_map.existing_hit_map_filenames(h5_filenames)
+todo = [f for f in h5_filenames if hit_map.make_hit_map_filename(f) not in existing]
 
-for h5_filename in h5_filenames:
-    if os.path.exists(hit_map.make_hit_map_filename(h5_filename)):
-        continue
-    hitmap = scanner.scan(h5_filename)
-    hitmap.save()
+# fork rather than spawn, so workers don't rerun this script's top level.
+# scanner.scan saves the hitmap itself, so nothing large is sent back to the parent.
+with multiprocessing.get_context("fork").Pool(processes=processes) as pool:
+    pool.map(scanner.scan, todo, chunksize=1)
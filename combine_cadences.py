@@ -6,8 +6,9 @@ and plot it.
 Usage: ./combine_cadences.py <cadencelist>.json <output>.events
 """
 
+from concurrent.futures import ThreadPoolExecutor
 import cupy as cp
-import json
+from matplotlib import pyplot as plt
 import os
 from pathlib import Path
 import psutil
@@ -15,10 +16,36 @@ import socket
 import sys
 
 from config import EVENT_ROOT
+from detect_cadences import read_cadences
 from event import Event
 from hit_map import HitMap
 from plot_event import save_event_plot
 
+# Reused for memory reporting, rather than reopening /proc or looking up the pool for each plot
+PROCESS = psutil.Process()
+MEMPOOL = cp.get_default_memory_pool()
+
+
+def load_hit_maps(filenames):
+    return [HitMap.load(f) for f in filenames]
+
+
+def iter_load_hit_maps(cadences):
+    """
+    cadences is a list of filename lists.
+    Yields (filenames, hit_maps) for each cadence.
+    The next cadence's hit maps are loaded in a background thread while the caller works on the current one.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = None
+        for filenames in cadences:
+            future = executor.submit(load_hit_maps, filenames)
+            if pending is not None:
+                yield pending[0], pending[1].result()
+            pending = (filenames, future)
+        if pending is not None:
+            yield pending[0], pending[1].result()
+
 
 def iter_combine_cadences(cadence_file, output_file=None):
     """
@@ -48,37 +75,44 @@ def iter_combine_cadences(cadence_file, output_file=None):
         print("found existing events file:", output_file)
         return
 
+    cadences = read_cadences(cadence_file)
+
     events = []
-    for line in open(cadence_file):
-        info = json.loads(line.strip())
-        filenames = info["filenames"]
-        hit_maps = [HitMap.load(f) for f in filenames]
+    for filenames, hit_maps in iter_load_hit_maps(cadences):
         new_events = [e for e in Event.find_events(hit_maps) if e.score() > 0]
         print(f"{len(new_events)} events found in {filenames[0]} etc")
         if not new_events:
             continue
         
+        # Only events without a plot need their data loaded
+        pending_events = Event.filter_pending(new_events)
+
         # Generate plots one file at a time, for data loading efficiency
-        chunks = None
-        newly_saved = 0
-        for event in new_events:
-            if not event.has_plot_file():
-                save_event_plot(event, maybe_reuse_chunks=chunks)
-                newly_saved += 1
-                mb_ram = psutil.Process().memory_info().rss // 10**6
-                gb_gpu = cp.get_default_memory_pool().total_bytes() // 10**6
-                print(f"memory usage: {mb_ram}M RAM, {gb_gpu}M GPU")
+        # The figure is also shared across plots, to avoid rebuilding its axes each time
+        if pending_events:
+            chunks = None
+            fig = plt.figure()
+            last_usage = None
+            for event in pending_events:
+                save_event_plot(event, maybe_reuse_chunks=chunks, fig=fig)
                 chunks = event.detach_chunks()
-            
+
+                # Only report memory usage when it changes
+                usage = (PROCESS.memory_info().rss // 10**6, MEMPOOL.total_bytes() // 10**6)
+                if usage != last_usage:
+                    print(f"memory usage: {usage[0]}M RAM, {usage[1]}M GPU")
+                    last_usage = usage
+            plt.close(fig)
+
         events.extend(new_events)
-        if newly_saved == 0:
+        if not pending_events:
             print(f"plots for these {len(new_events)} events have already been generated")
         yield
 
     print(len(events), "total events found")
         
     # When we save events we want to do it best-first
-    events.sort(key=lambda e: -e.score())
+    events.sort(key=Event.score, reverse=True)
     Event.save_list(events, output_file)
     print("combine_cadences complete. event list saved to", output_file)
 
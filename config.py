@@ -38,7 +38,7 @@ def front_replace(s, old, new):
     s must start with old.
     """
     assert s.startswith(old)
-    return s.replace(old, new, 1)
+    return new + s[len(old):]
 
 
 def make_relative_filename(h5_filename, root_dir, new_suffix):
@@ -53,3 +53,17 @@ def make_hit_map_filename(h5_filename):
 def make_plot_filename(h5_filename, index):
     return make_relative_filename(h5_filename, IMAGE_ROOT, f".{index}.png")
 
+
+def existing_filenames(filenames):
+    """
+    Returns the set of these filenames that exist.
+    This lists each directory once, rather than doing a stat per file.
+    """
+    filenames = list(filenames)
+    listed = set()
+    for dirname in set(os.path.dirname(f) for f in filenames):
+        if not os.path.isdir(dirname):
+            continue
+        with os.scandir(dirname) as entries:
+            listed.update(entry.path for entry in entries if entry.is_file())
+    return set(f for f in filenames if f in listed)
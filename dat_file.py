@@ -3,13 +3,15 @@
 Tools to analyze the .dat file format, for example turboseti output.
 """
 
+import numpy as np
 import os
+import pandas as pd
 import random
 import re
 import time
 
 from config import H5_ROOT, MARGIN
-from hit_info import HitInfo
+from hit_info import HitInfo, group_columns
 
 DIR = os.path.dirname(os.path.realpath(__file__))
 
@@ -20,53 +22,62 @@ COARSE_CHANNEL_SIZE = 2**20
 
 class DatFile(object):
     """
-    self.hits maps coarse index to a list of (first column, last column) pairs.
+    self.hits maps coarse index to a (first columns, last columns) pair of arrays.
     """
     def __init__(self, filename):
         self.filename = filename
 
-        # self.groups[coarse index] is a list of fine indices.
+        # self.hits[coarse index] is a pair of parallel int64 arrays, in file order.
         self.hits = {}
 
+        # The header is all at the top of the file, so we can stop reading at the first hit
         header = {}
-
+        has_data = False
         for line in open(self.filename):
+            if not line.startswith("#"):
+                if len(line.split()) != 12:
+                    raise ValueError("unexpected dat file format")
+                has_data = True
+                break
 
-            if line.startswith("#"):
-                parts = line.split()
-                pairs = zip(parts, parts[1:])
-                for key_colon, value in pairs:
-                    if not key_colon.endswith(":"):
-                        continue
-                    key = key_colon.strip(":")
-                    header[key] = value
-                continue
-
-            # Calculate how much drift rate you need to drift one pixel
-            deltaf = float(header["DELTAF(Hz)"])
-            obs_length = float(header["obs_length"])
-            drift_rate_per_pixel = deltaf / obs_length
-            
             parts = line.split()
-            if len(parts) != 12:
-                raise ValueError("unexpected dat file format")
-            drift_rate = float(parts[1])
-            start_fine_index = int(parts[5])
-            coarse_index = int(parts[10])
-
-            # Calculate how many pixels this signal drifted by
-            # Can be positive or negative
-            float_drift_pixels = drift_rate / drift_rate_per_pixel
-            drift_pixels = round(float_drift_pixels)
-            assert abs(float_drift_pixels - drift_pixels) < 0.01
-            end_fine_index = start_fine_index + drift_pixels
-
-            first_column, last_column = sorted([start_fine_index, end_fine_index])
-            
-            if coarse_index not in self.hits:
-                self.hits[coarse_index] = []
-            offset = coarse_index * COARSE_CHANNEL_SIZE
-            self.hits[coarse_index].append(HitInfo(first_column, last_column, offset=offset))
+            pairs = zip(parts, parts[1:])
+            for key_colon, value in pairs:
+                if not key_colon.endswith(":"):
+                    continue
+                key = key_colon.strip(":")
+                header[key] = value
+
+        if not has_data:
+            return
+
+        # Calculate how much drift rate you need to drift one pixel
+        deltaf = float(header["DELTAF(Hz)"])
+        obs_length = float(header["obs_length"])
+        drift_rate_per_pixel = deltaf / obs_length
+
+        # The columns we need are drift rate, start fine index, and coarse index
+        columns = pd.read_csv(self.filename, sep=r"\s+", comment="#", header=None, usecols=[1, 5, 10], engine="c",
+                              dtype={1: np.float64, 5: np.int64, 10: np.int64})
+        drift_rates = columns[1].to_numpy()
+        start_fine_indexes = columns[5].to_numpy()
+        coarse_indexes = columns[10].to_numpy()
+
+        # Calculate how many pixels each signal drifted by
+        # Can be positive or negative
+        float_drift_pixels = drift_rates / drift_rate_per_pixel
+        drift_pixels = np.round(float_drift_pixels)
+        assert np.all(np.abs(float_drift_pixels - drift_pixels) < 0.01)
+        end_fine_indexes = start_fine_indexes + drift_pixels.astype(np.int64)
+
+        first_columns = np.minimum(start_fine_indexes, end_fine_indexes)
+        last_columns = np.maximum(start_fine_indexes, end_fine_indexes)
+
+        # Group by coarse index, keeping the hits within each coarse channel in file order
+        order = np.argsort(coarse_indexes, kind="stable")
+        unique_coarse, group_starts = np.unique(coarse_indexes[order], return_index=True)
+        for coarse_index, group in zip(unique_coarse.tolist(), np.split(order, group_starts[1:])):
+            self.hits[coarse_index] = (first_columns[group], last_columns[group])
 
             
     def h5_filename(self):
@@ -114,11 +125,12 @@ class DatFile(object):
         Combines nearby hits.
         """
         assert self.has_hits()
-        answer = []
-        for hit in self.hits[coarse_index]:
-            if answer and answer[-1].can_join(hit, check_distance=True):
-                answer[-1] = answer[-1].join(hit)
-            else:
-                answer.append(hit)
-        return answer
+        first_columns, last_columns = self.hits[coarse_index]
+
+        # A combined hit starts wherever there is more than MARGIN of space after everything before it
+        order, starts = group_columns(first_columns, last_columns, MARGIN)
+        group_first_columns = first_columns[order][starts].tolist()
+        group_last_columns = np.maximum.reduceat(last_columns[order], starts).tolist()
+        return [HitInfo(coarse_index, COARSE_CHANNEL_SIZE, first_column, last_column)
+                for first_column, last_column in zip(group_first_columns, group_last_columns)]
 
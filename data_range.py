@@ -3,10 +3,13 @@ The DataRange represents a part of an underlying H5 file.
 """
 
 import cp
+import numpy as np
 
 from config import DISPLAY_WIDTH, MARGIN
 
 class DataRange(object):
+    __slots__ = ["h5_file", "offset", "array"]
+
     def __init__(self, h5_file, offset, array):
         """
         offset is the horizontal offset in the h5 file.
@@ -34,18 +37,22 @@ class DataRange(object):
             raise ValueError(f"in get_range, end ({end}) > len(self) ({len(self)})")
         new_offset = self.offset + begin
         answer = DataRange(self.h5_file, new_offset, self.array[:, begin:end])
+        return answer
 
     def display_region(self, first, last):
         """
         A region to display, centered around the [first:last] range, inclusive.
         first and last are relative to this DataRange object.
         Always returns a numpy array, not a cupy array.
+        If the data is already in numpy, this is a view rather than a copy.
         """
         display_width = max(DISPLAY_WIDTH, last - first + 2 * MARGIN)
         center = (first + last) / 2
         ideal_display_offset = center - (display_width - 1) / 2
         display_offset = int(ideal_display_offset)
         region = self.array[:, display_offset : display_offset + display_width]
+        if isinstance(region, np.ndarray):
+            return region
         return cp.asnumpy(region)
 
     def filename(self):
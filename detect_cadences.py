@@ -11,12 +11,24 @@ This is idempotent; if the file already exists it just exits.
 """
 
 import json
+import mmap
+import numpy as np
+import orjson
 import os
 import sys
 
 from h5_file import H5File
 
 
+def read_metadata(filename):
+    """
+    Returns a (timestamp, source_name, filename) tuple.
+    Only header attributes are read, so the chunk cache is turned off.
+    """
+    h5_file = H5File(filename, rdcc_nbytes=0)
+    return (h5_file.timestamp(), h5_file.source_name(), filename)
+
+
 def detect_cadences(directory):
     cadence_file = os.path.join(directory, "cadences.json")
     if os.path.exists(cadence_file):
@@ -26,38 +38,54 @@ def detect_cadences(directory):
     print("detecting cadences in", directory)
     contents = os.listdir(directory)
 
-    # (timestamp, source_name, filename) tuples
-    info = []
-
-    for basename in contents:
-        filename = os.path.join(directory, basename)
-        if not filename.endswith(".0000.h5"):
-            continue
-        h5_file = H5File(filename)
-        timestamp = h5_file.timestamp()
-        source_name = h5_file.source_name()
-        data = (timestamp, source_name, filename)
-        info.append(data)
+    filenames = [os.path.join(directory, basename) for basename in contents if basename.endswith(".0000.h5")]
 
+    # (timestamp, source_name, filename) tuples
+    info = [read_metadata(filename) for filename in filenames]
     info.sort()
 
     cadences = []
-    
-    while len(info) >= 6:
-        candidates = info[:6]
-        target = candidates[0][1]
-        if target == candidates[2][1] == candidates[4][1] and target not in [candidates[i][1] for i in (1, 3, 5)]:
-            cadences.append({"filenames": [filename for _, _, filename in candidates]})
-            info = info[6:]
-        else:
-            info = info[1:]
+
+    # A cadence is six consecutive files in an ABACAD pattern.
+    # Check every length-6 window at once, then take matching windows greedily from the front, without overlaps.
+    if len(info) >= 6:
+        names = np.array([source_name for _, source_name, _ in info])
+        a, b, c, d, e, f = [names[i : len(names) - 5 + i] for i in range(6)]
+        matches = (a == c) & (a == e) & (a != b) & (a != d) & (a != f)
+        next_start = 0
+        for start in np.flatnonzero(matches).tolist():
+            if start < next_start:
+                continue
+            cadences.append({"filenames": [filename for _, _, filename in info[start : start + 6]]})
+            next_start = start + 6
 
     cadence_file = os.path.join(directory, "cadences.json")
     with open(cadence_file, "w") as outfile:
         for cadence in cadences:
             outfile.write(json.dumps(cadence) + "\n")
     print(f"{len(cadences)} cadences detected. writing information to {cadence_file}")
-            
+
+
+def read_cadences(cadence_file):
+    """
+    Reads a cadences.json file in the format detect_cadences creates.
+    Returns a list of cadences, where each cadence is a list of filenames.
+    """
+    cadences = []
+    with open(cadence_file, "rb") as infile:
+        # mmap refuses empty files, and an empty file just means there are no cadences
+        if os.fstat(infile.fileno()).st_size == 0:
+            return cadences
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = 0
+            while pos < len(mm):
+                end = mm.find(b"\n", pos)
+                if end < 0:
+                    end = len(mm)
+                cadences.append(orjson.loads(mm[pos:end])["filenames"])
+                pos = end + 1
+    return cadences
+
 
 if __name__ == "__main__":
     directory = sys.argv[1]
@@ -3,14 +3,17 @@
 Information for an event candidate.
 """
 
-from astropy.time import Time
 from datetime import datetime
+import heapq
+import numpy as np
+from operator import attrgetter
 import os
+import sys
 
 from fastavro import parse_schema, reader, writer
 
-from config import MARGIN, make_plot_filename
-from hit_info import HitInfo, HIT_INFO_SCHEMA
+from config import MARGIN, existing_filenames, make_plot_filename
+from hit_info import HitInfo, HIT_INFO_SCHEMA, group_columns
 from scanner import Scanner
 
 
@@ -56,11 +59,22 @@ EVENT_SCHEMA = {
 
 PARSED_EVENT_SCHEMA = parse_schema(EVENT_SCHEMA)
 
+# Month abbreviations for readable dates, as strftime's %b gives in the C locale
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+# The MJD of 1970-01-01
+MJD_UNIX_EPOCH = 40587.0
+
 # This is specific to Green Bank.
 NOTCH_FILTERS = [(1200, 1340), (2300, 2360)]
 
 class Event(object):
     normal_fields = ["h5_filenames", "source_name", "fch1", "foff", "nchans", "tstarts", "coarse_channels"]
+    get_normal_fields = attrgetter(*normal_fields)
+
+    # There can be many events in memory at once, so they don't get a per-instance __dict__
+    __slots__ = normal_fields + ["hits", "hit_maps", "coarse_channel", "min_first_column", "max_last_column", "chunks",
+                                 "cached_start_times", "cached_score", "cached_plot_filename", "plot_exists"]
 
     def __init__(self, hits, hit_maps=None):
         """
@@ -73,17 +87,23 @@ class Event(object):
         self.hits = hits
         self.hit_maps = hit_maps
 
-        for hit in self.hits:
-            if hit is not None:
-                self.coarse_channel = hit.coarse_channel
-                break
-        else:
+        present_hits = [hit for hit in self.hits if hit is not None]
+        if not present_hits:
             raise RuntimeError("an all-None list of hits was passed to Event creation")
+        self.coarse_channel = present_hits[0].coarse_channel
+
+        # The hits don't change after creation, so the column range is computed up front
+        self.min_first_column = min(hit.first_column for hit in present_hits)
+        self.max_last_column = max(hit.last_column for hit in present_hits)
                 
         # Populate metadata from the hitmaps
         if hit_maps is not None:
-            self.h5_filenames = [hit_map.h5_filename for hit_map in hit_maps]
-            self.tstarts = [hit_map.tstart for hit_map in hit_maps]
+            # Many events share the same few filenames, so they are interned to share storage
+            self.h5_filenames = []
+            self.tstarts = []
+            for hit_map in hit_maps:
+                self.h5_filenames.append(sys.intern(hit_map.h5_filename))
+                self.tstarts.append(hit_map.tstart)
             self.fch1 = hit_maps[0].fch1
             self.foff = hit_maps[0].foff
             self.nchans = hit_maps[0].nchans
@@ -92,25 +112,31 @@ class Event(object):
         
         # Lazily populated
         self.chunks = None
+        self.cached_start_times = None
+        self.cached_score = None
+        self.cached_plot_filename = None
+
+        # Only a positive answer is remembered, since the plot may be created later
+        self.plot_exists = False
 
                 
     def first_column(self):
         """
         Relative to the coarse channel.
         """
-        return min(h.first_column for h in self.hits if h)
+        return self.min_first_column
 
     def last_column(self):
         """
         Relative to the coarse channel.
         """
-        return max(h.last_column for h in self.hits if h)
+        return self.max_last_column
 
     def on_hits(self):
-        return [hit for (i, hit) in enumerate(self.hits) if hit is not None and i % 2 == 0]
+        return [hit for hit in self.hits[::2] if hit is not None]
 
     def off_hits(self):
-        return [hit for (i, hit) in enumerate(self.hits) if hit is not None and i % 2 == 1]
+        return [hit for hit in self.hits[1::2] if hit is not None]
 
     def combined_snr(self):
         """
@@ -127,19 +153,21 @@ class Event(object):
         The top-level heuristic.
         Roughly maps to SNR.
         A positive score indicates a human should look at it.
+        The hits don't change, so this is cached.
         """
-        if self.total_columns() <= 3:
+        if self.cached_score is None:
+            self.cached_score = self.calculate_score()
+        return self.cached_score
+
+    def calculate_score(self):
+        # The cheap checks come first, since most events are rejected
+        total_columns = self.total_columns()
+        if total_columns <= 3:
             # It's a vertical line, no matter how cadencey it is
             return 0
 
-        # Check for the notch filter
-        freq1, freq2 = self.frequency_range()
-        for low, high in NOTCH_FILTERS:
-            if low <= freq1 <= high and low <= freq2 <= high:
-                return 0
-
         # If it's too large, we assume it's noise.
-        if self.total_columns() > 300:
+        if total_columns > 300:
             return 0
             
         num_on = len(self.on_hits())
@@ -148,6 +176,13 @@ class Event(object):
             return 0
         if num_off > 1:
             return 0
+
+        # Check for the notch filter
+        freq1, freq2 = self.frequency_range()
+        for low, high in NOTCH_FILTERS:
+            if low <= freq1 <= high and low <= freq2 <= high:
+                return 0
+
         snr = self.combined_snr()
         if snr < 2:
             return 0
@@ -155,38 +190,74 @@ class Event(object):
     
     
     def total_columns(self):
-        on_hits = self.on_hits()
-        if not on_hits:
+        """
+        The width of the on-hits, found in a single pass.
+        """
+        min_first_column = None
+        for hit in self.hits[::2]:
+            if hit is None:
+                continue
+            if min_first_column is None:
+                min_first_column, max_last_column = hit.first_column, hit.last_column
+            else:
+                min_first_column = min(min_first_column, hit.first_column)
+                max_last_column = max(max_last_column, hit.last_column)
+        if min_first_column is None:
             return 0
-        min_first_column = min(hit.first_column for hit in on_hits)
-        max_last_column = max(hit.last_column for hit in on_hits)
         return max_last_column - min_first_column + 1
     
     def session(self):
         """
         Heuristic. Returns None if it can't figure it out.
         """
-        for part in self.h5_filenames[0].split("/"):
-            if "GBT" in part:
-                return part
-        return None
+        filename = self.h5_filenames[0]
+        i = filename.find("GBT")
+        if i < 0:
+            return None
+        begin = filename.rfind("/", 0, i) + 1
+        end = filename.find("/", i)
+        return filename[begin:] if end < 0 else filename[begin:end]
     
     def offset(self):
         coarse_channel_size = self.nchans // self.coarse_channels
         return self.coarse_channel * coarse_channel_size
     
     def plot_filename(self):
-        return make_plot_filename(self.h5_filenames[0], self.offset() + self.first_column())
+        if self.cached_plot_filename is None:
+            self.cached_plot_filename = make_plot_filename(self.h5_filenames[0], self.offset() + self.first_column())
+        return self.cached_plot_filename
 
     def has_plot_file(self):
-        return os.path.exists(self.plot_filename())
+        if not self.plot_exists:
+            self.plot_exists = os.path.isfile(self.plot_filename())
+        return self.plot_exists
+
+    @staticmethod
+    def find_plot_files(events):
+        """
+        Sets plot_exists on each event whose plot file already exists.
+        """
+        plot_filenames = [event.plot_filename() for event in events]
+        existing = existing_filenames(plot_filenames)
+        for event, plot_filename in zip(events, plot_filenames):
+            if plot_filename in existing:
+                event.plot_exists = True
+
+    @staticmethod
+    def filter_pending(events):
+        """
+        Returns the events that don't have a plot file yet.
+        """
+        Event.find_plot_files(events)
+        return [event for event in events if not event.plot_exists]
     
     def frequency_range(self):
         """
         Returns (first_freq, last_freq) that corresponds to the first and last column.
         """
-        first_index = self.offset() + self.first_column()
-        last_index = self.offset() + self.last_column()
+        offset = self.offset()
+        first_index = offset + self.min_first_column
+        last_index = offset + self.max_last_column
         first_freq = self.fch1 + first_index * self.foff
         last_freq = self.fch1 + last_index * self.foff
         return (first_freq, last_freq)
@@ -223,18 +294,26 @@ class Event(object):
         return answer
             
     def start_times(self):
-        return [datetime.utcfromtimestamp(Time(tstart, format="mjd").unix) for tstart in self.tstarts]
+        """
+        Converts the tstarts from MJD and caches the result.
+        Unix time ignores leap seconds, just like MJD, so this is a plain linear conversion. It gives the same answer as
+        astropy's Time(..., format="mjd").unix without the cost of constructing Time objects.
+        """
+        if self.cached_start_times is None:
+            unix_times = (np.asarray(self.tstarts, dtype=np.float64) - MJD_UNIX_EPOCH) * 86400.0
+            self.cached_start_times = [datetime.utcfromtimestamp(t) for t in unix_times.tolist()]
+        return self.cached_start_times
             
     def readable_day_range(self):
         times = self.start_times()
         first_dt = times[0]
         last_dt = times[-1]
-        first_phrase = first_dt.strftime("%Y %b ") + str(first_dt.day)
+        first_phrase = f"{first_dt.year} {MONTHS[first_dt.month - 1]} {first_dt.day}"
         if last_dt.day == first_dt.day:
             return first_phrase
         if last_dt.month == first_dt.month:
             return f"{first_phrase}-{last_dt.day}"
-        return f"{first_phrase} - {last_dt.strftime('%b')} {last_dt.day}"
+        return f"{first_phrase} - {MONTHS[last_dt.month - 1]} {last_dt.day}"
 
     
     @staticmethod
@@ -244,53 +323,48 @@ class Event(object):
         An event is currently defined as any two hits within MARGIN of each other.
         """
         if coarse_channel is None:
-            for coarse_channel in range(hit_maps[0].coarse_channels):
+            # Coarse channels with no hits in any hit map can't have any events
+            coarse_channels = set()
+            for hit_map in hit_maps:
+                coarse_channels.update(hit_map.coarse_channels_with_hits())
+            for coarse_channel in sorted(coarse_channels):
                 for event in Event.find_events(hit_maps, coarse_channel=coarse_channel):
                     yield event
             return
 
-        # Entries in labeled_hits are
+        # The grouping only looks at the column arrays.
+        # The HitInfo objects are only looked up for groups that can become events.
+        hit_lists = [hit_map.hits_for_coarse_channel(coarse_channel, attach_chunk=False) for hit_map in hit_maps]
+        columns = [hit_map.columns_for_coarse_channel(coarse_channel) for hit_map in hit_maps]
+        first_columns = np.concatenate([c[0] for c in columns])
+        plausible_next_columns = np.concatenate([c[2] for c in columns])
+        hit_map_indices = np.repeat(np.arange(len(hit_maps)), [len(hits) for hits in hit_lists])
+        positions = np.concatenate([np.arange(len(hits)) for hits in hit_lists])
+
+        # Group up the hits.
+        # A hit starts a new group when no earlier hit plausibly continues as far as its first column.
+        # The sort is stable, so ties stay in hit map order.
+        order, starts = group_columns(first_columns, plausible_next_columns, 0)
+        hit_map_indices = hit_map_indices[order].tolist()
+        positions = positions[order].tolist()
+        bounds = np.r_[starts, len(first_columns)].tolist()
+
+        # Entries in each group are
         # (hit_map_index, hit)
         # where the hit_map_index tracks which hit map the hit came from.
-        labeled_hits = []
-        for hit_map_index, hit_map in enumerate(hit_maps):
-            hits = hit_map.hits_for_coarse_channel(coarse_channel, attach_chunk=False)
-            for hit in hits:
-                labeled_hits.append((hit_map_index, hit))
-
-        labeled_hits.sort(key=lambda x: x[1].first_column)
-
-        # Group up the labeled hits
         groups = []
-        current_group = []
-        plausible_next_column = None
-        for index, hit in labeled_hits:
-            if not current_group:
-                # Make a new group with only this hit
-                current_group.append((index, hit))
-                plausible_next_column = hit.plausible_next_column()
-                continue
-            if plausible_next_column >= hit.first_column:
-                # Add this hit to the group
-                current_group.append((index, hit))
-                plausible_next_column = max(plausible_next_column, hit.plausible_next_column())
-                continue
-            # Make current group into a group and start a new group with this hit
-            groups.append(current_group)
-            current_group = [(index, hit)]
-            plausible_next_column = hit.plausible_next_column()
-        if current_group:
-            groups.append(current_group)
-
-
-        groups = [g for g in groups if len(g) > 1]
+        for begin, end in zip(bounds, bounds[1:]):
+            if end - begin > 1:
+                groups.append([(hit_map_indices[i], hit_lists[hit_map_indices[i]][positions[i]])
+                               for i in range(begin, end)])
         if not groups:
             return
 
         # Construct events for this coarse channel
         events = []
+        no_hits = [None] * len(hit_maps)
         for group in groups:
-            hits = [None] * len(hit_maps)
+            hits = no_hits.copy()
             for (index, hit) in group:
                 if hits[index] is None:
                     hits[index] = hit
@@ -306,9 +380,8 @@ class Event(object):
 
         # Filter to limit the number of events per coarse channel, as an anti-noise measure
         max_events_per_channel = 50
-        events.sort(key=lambda e: -e.score())
-        events = events[:max_events_per_channel]
-        events.sort(key=lambda e: e.first_column())
+        events = heapq.nlargest(max_events_per_channel, events, key=Event.score)
+        events.sort(key=Event.first_column)
         for event in events:
             yield event
 
@@ -329,42 +402,32 @@ class Event(object):
 
 
     def to_plain(self):
-        hits = []
-        for hit in self.hits:
-            if hit is None:
-                hits.append(None)
-            else:
-                hits.append(hit.to_plain())
-        plain = {"hits": hits}
-        for field in Event.normal_fields:
-            plain[field] = getattr(self, field)
+        plain = {"hits": [None if hit is None else hit.to_plain() for hit in self.hits]}
+        plain.update(zip(Event.normal_fields, Event.get_normal_fields(self)))
         return plain
 
     @staticmethod
     def from_plain(plain):
         chunk_size = plain["nchans"] // plain["coarse_channels"]
-        hits = []
-        for plain_hit in plain["hits"]:
-            if plain_hit is None:
-                hits.append(None)
-            else:
-                hits.append(HitInfo.from_plain(plain_hit, chunk_size))
-        event = Event(hits)
-        for field in Event.normal_fields:
-            setattr(event, field, plain[field])
+        event = Event([None if h is None else HitInfo.from_plain(h, chunk_size) for h in plain["hits"]])
+        event.h5_filenames = [sys.intern(f) for f in plain["h5_filenames"]]
+        event.source_name = sys.intern(plain["source_name"])
+        event.fch1 = plain["fch1"]
+        event.foff = plain["foff"]
+        event.nchans = plain["nchans"]
+        event.tstarts = plain["tstarts"]
+        event.coarse_channels = plain["coarse_channels"]
         return event
 
     @staticmethod
     def save_list(events, filename):
         filename = os.path.expanduser(filename)
         assert filename.endswith(".events")
-        plain = []
-        for event in events:
-            assert type(event) is Event
-            plain.append(event.to_plain())
+        assert all(type(event) is Event for event in events)
         try:
             with open(filename, "wb") as outfile:
-                writer(outfile, PARSED_EVENT_SCHEMA, plain)
+                # fastavro accepts any iterable, so the plain records are never all in memory at once
+                writer(outfile, PARSED_EVENT_SCHEMA, (event.to_plain() for event in events))
         except:
             # Don't leave some half-written file there
             os.remove(filename)
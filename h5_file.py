@@ -10,6 +10,7 @@ import h5py
 
 from astropy.time import Time
 import cp
+import numpy as np
 import os
 import random
 
@@ -20,9 +21,12 @@ DIR = os.path.dirname(os.path.realpath(__file__))
 
 
 class H5File(object):
-    def __init__(self, filename):
+    def __init__(self, filename, **kwargs):
+        """
+        Any kwargs are passed on to h5py.File, for example to size the chunk cache.
+        """
         assert h5py.is_hdf5(filename), f"{filename} does not appear to be an hdf5 file"
-        self.h5file = h5py.File(filename, "r")
+        self.h5file = h5py.File(filename, "r", **kwargs)
         self.data = self.h5file["data"]
         self.height, _, self.width = self.data.shape
         if self.width == 64 * 1048576:
@@ -46,7 +50,17 @@ class H5File(object):
     def get_chunk(self, i):
         assert 0 <= i < self.num_chunks
         offset = i * self.chunk_size
-        array = cp.array(self.data[:, 0, offset : offset + self.chunk_size])
+
+        # hdf5 decompresses straight into page-locked host memory, which the GPU can copy from directly.
+        # cp.array would first copy a pageable array into its own page-locked staging buffer.
+        # The pinned memory comes from cupy's pool, so it is reused from chunk to chunk.
+        shape = (self.height, self.chunk_size)
+        pinned = cp.cuda.alloc_pinned_memory(self.height * self.chunk_size * self.data.dtype.itemsize)
+        buf = np.frombuffer(pinned, dtype=self.data.dtype, count=self.height * self.chunk_size).reshape(shape)
+        self.data.read_direct(buf, source_sel=np.s_[:, 0, offset : offset + self.chunk_size], dest_sel=np.s_[:, :])
+        array = cp.empty(shape, dtype=self.data.dtype)
+        # Without a stream, set copies synchronously, so buf can be released afterwards
+        array.set(buf)
 
         # Blur out the exact middle, that's the DC spike
         midpoint = self.chunk_size // 2
@@ -87,8 +87,11 @@ class HitInfo(object):
         coarse_channel = offset // coarse_channel_size
         info = HitInfo(coarse_channel, coarse_channel_size, first_column, plain["last_column"] - offset)
 
-        for field in HitInfo.normal_fields:
-            setattr(info, field, plain[field])
+        info.drift_rate = plain["drift_rate"]
+        info.drift_start = plain["drift_start"]
+        info.snr = plain["snr"]
+        info.mse = plain["mse"]
+        info.area = plain["area"]
         return info
 
 
@@ -98,25 +101,17 @@ class HitInfo(object):
         We can only convert a field to plain once linear_fit has been called.
         """
         assert self.drift_rate is not None, "HitInfo to_plain can only be called with linear fit data"
-        plain = {
+        return {
             "first_column": self.offset + self.first_column,
             "last_column": self.offset + self.last_column,
+            "drift_rate": self.drift_rate,
+            "drift_start": self.drift_start,
+            "snr": self.snr,
+            "mse": self.mse,
+            "area": self.area,
         }
-        for field in HitInfo.normal_fields:
-            plain[field] = getattr(self, field)
-        return plain
         
         
-    @staticmethod
-    def from_hit_windows(hit_windows, coarse_channel, data):
-        """
-        Construct a HitInfo from a list of hit windows.
-        A hit window is a (row, first_column, last_column) tuple.
-        """
-        first_column = min(first_column for _, first_column, _ in hit_windows)
-        last_column = max(last_column for _, _, last_column in hit_windows)
-        return HitInfo(coarse_channel, len(data), first_column, last_column, hit_windows=hit_windows, data=data)
-    
     def plausible_next_column(self):
         """
         Guess how far after last_column we should look to find the next hit.
@@ -244,6 +239,23 @@ class HitInfo(object):
         return str(self)
 
 
+def group_columns(first_columns, last_columns, margin):
+    """
+    Groups hits given as arrays of their first and last columns.
+    A hit starts a new group when it is more than margin past the last column of every earlier hit.
+    Returns (order, starts), where order is a stable argsort of first_columns, and starts holds the index in
+    sorted order where each group begins.
+    """
+    order = np.argsort(first_columns, kind="stable")
+    first_columns = first_columns[order]
+
+    # Since hits are sorted by first column, a running max over all earlier hits gives the same groups as
+    # tracking the max within the current group.
+    reach = np.maximum.accumulate(last_columns[order])
+    starts = np.flatnonzero(np.r_[True, reach[:-1] + margin < first_columns[1:]])
+    return order, starts
+
+
 def group_hit_windows(hit_windows, coarse_channel, data):
     """
     Return a list of HitInfo objects.
@@ -255,31 +267,20 @@ def group_hit_windows(hit_windows, coarse_channel, data):
     Hit groups are also combined to keep the data small in noisy areas, so that we have a certain limit for the number of
     hit groups per coarse channel.
     """
-    # sort by first_column
-    sorted_hit_windows = sorted(hit_windows, key=lambda hit: hit[1])
-
     groups = []
-    pending_group = None
-    pending_last_column = None
-    for hit in sorted_hit_windows:
-        _, first_column, last_column = hit
-        if pending_last_column is None:
-            # This is the first hit. Make a pending group
-            pending_group = [hit]
-            pending_last_column = last_column
-        elif pending_last_column + MARGIN >= first_column:
-            # Combine this hit into the previous hit group
-            pending_group.append(hit)
-            pending_last_column = max(pending_last_column, last_column)
-        else:
-            # This hit goes into its own group
-            groups.append(HitInfo.from_hit_windows(pending_group, coarse_channel, data))
-            pending_group = [hit]
-            pending_last_column = last_column
-
-    if pending_group is not None:
-        # Turn the last pending group into a full group
-        groups.append(HitInfo.from_hit_windows(pending_group, coarse_channel, data))
+    if len(hit_windows) > 0:
+        first_columns = np.fromiter((hit[1] for hit in hit_windows), dtype=np.int64, count=len(hit_windows))
+        last_columns = np.fromiter((hit[2] for hit in hit_windows), dtype=np.int64, count=len(hit_windows))
+        order, starts = group_columns(first_columns, last_columns, MARGIN)
+        first_columns = first_columns[order]
+        last_columns = last_columns[order]
+        sorted_hit_windows = [hit_windows[i] for i in order.tolist()]
+        group_first_columns = first_columns[starts].tolist()
+        group_last_columns = np.maximum.reduceat(last_columns, starts).tolist()
+        bounds = np.r_[starts, len(sorted_hit_windows)].tolist()
+        for begin, end, first_column, last_column in zip(bounds, bounds[1:], group_first_columns, group_last_columns):
+            groups.append(HitInfo(coarse_channel, len(data), first_column, last_column,
+                                  hit_windows=sorted_hit_windows[begin:end], data=data))
 
     max_groups = 1000
     if len(groups) > max_groups:
@@ -303,24 +304,25 @@ def diff(list1, list2):
     """
     Takes two lists of hits.
     A hit can be anything with .first_column and .last_column on it.
-    list2 must be sorted.
+    list2 must be sorted, with no overlaps.
     Returns the groups that are in list1 but do not overlap any groups in list2.
     """
     if not list2:
         return list1
-    
-    # We will recursively split list2
-    mid_index = len(list2) // 2
-    mid_hit = list2[mid_index]
-    
-    before_mid_hit = []
-    after_mid_hit = []
-    for hit in list1:
-        if hit.last_column < mid_hit.first_column:
-            before_mid_hit.append(hit)
-        if mid_hit.last_column < hit.first_column:
-            after_mid_hit.append(hit)
-
-    return diff(before_mid_hit, list2[:mid_index]) + diff(after_mid_hit, list2[mid_index+1:])
-
-
+    if not list1:
+        return []
+
+    first_columns2 = np.fromiter((hit.first_column for hit in list2), dtype=np.int64, count=len(list2))
+    last_columns2 = np.fromiter((hit.last_column for hit in list2), dtype=np.int64, count=len(list2))
+    first_columns1 = np.fromiter((hit.first_column for hit in list1), dtype=np.int64, count=len(list1))
+    last_columns1 = np.fromiter((hit.last_column for hit in list1), dtype=np.int64, count=len(list1))
+
+    # The only list2 hit that can overlap a list1 hit is the last one starting at or before the list1 hit's end
+    index = np.searchsorted(first_columns2, last_columns1, side="right")
+    candidate_last_columns = last_columns2[np.maximum(index - 1, 0)]
+    keep = (index == 0) | (candidate_last_columns < first_columns1)
+
+    # Results are ordered by where they fall among the list2 hits
+    kept = np.flatnonzero(keep)
+    kept = kept[np.argsort(index[kept], kind="stable")]
+    return [list1[i] for i in kept.tolist()]
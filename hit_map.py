@@ -7,13 +7,15 @@ convenient to have an extensible, schema-defined format as well.
 """
 
 import json
+import numpy as np
+from operator import attrgetter
 import os
 from pathlib import Path
 import sys
 
 from fastavro import parse_schema, reader, writer
 
-from config import make_hit_map_filename
+from config import MARGIN, existing_filenames, make_hit_map_filename
 from h5_file import H5File
 from hit_info import HitInfo, HIT_INFO_SCHEMA
 
@@ -88,6 +90,8 @@ class HitMap(object):
         Create a HitMap with no hits but the metadata from a provided h5 file.
         """
         hitmap = HitMap()
+        # Keep the file that is already open, so populate_h5_file doesn't open it again
+        hitmap.h5_file = f
         hitmap.h5_filename = f.filename()
         hitmap.hits = []
         hitmap.fch1 = f.get_attr("fch1")
@@ -110,6 +114,9 @@ class HitMap(object):
             for h in new_hits:
                 h.data = None
         self.hits.extend(new_hits)
+        if hasattr(self, "hits_by_coarse_channel"):
+            del self.hits_by_coarse_channel
+            del self.columns_by_coarse_channel
 
     def chunk_size(self):
         return self.nchans // self.coarse_channels
@@ -176,20 +183,52 @@ class HitMap(object):
         return self.fch1 + self.foff * i
         
     
+    def populate_hits_by_coarse_channel(self):
+        """
+        Indexes the hits by coarse channel in a single pass, so that looking at every coarse channel in turn doesn't
+        rescan all the hits each time.
+        Within each coarse channel, hits are sorted by first column.
+        """
+        if hasattr(self, "hits_by_coarse_channel"):
+            return
+        self.hits_by_coarse_channel = {}
+        for hit in sorted(self.hits, key=attrgetter("first_column")):
+            self.hits_by_coarse_channel.setdefault(hit.coarse_channel, []).append(hit)
+
+        # The same hits as parallel arrays, so that grouping doesn't have to touch the HitInfo objects
+        self.columns_by_coarse_channel = {}
+        for coarse_channel, hits in self.hits_by_coarse_channel.items():
+            first_columns = np.fromiter((hit.first_column for hit in hits), dtype=np.int32, count=len(hits))
+            last_columns = np.fromiter((hit.last_column for hit in hits), dtype=np.int32, count=len(hits))
+            plausible_next_columns = 3 * last_columns - 2 * first_columns + MARGIN
+            self.columns_by_coarse_channel[coarse_channel] = (first_columns, last_columns, plausible_next_columns)
+
+    def coarse_channels_with_hits(self):
+        self.populate_hits_by_coarse_channel()
+        return self.hits_by_coarse_channel.keys()
+            
+    def columns_for_coarse_channel(self, coarse_channel):
+        """
+        Returns (first_columns, last_columns, plausible_next_columns) arrays, parallel to the list that
+        hits_for_coarse_channel returns.
+        """
+        self.populate_hits_by_coarse_channel()
+        empty = np.zeros(0, dtype=np.int32)
+        return self.columns_by_coarse_channel.get(coarse_channel, (empty, empty, empty))
+
     def hits_for_coarse_channel(self, coarse_channel, attach_chunk=True):
         """
-        Returns the hits for the coarse channel with the given index.
+        Returns the hits for the coarse channel with the given index, sorted by first column.
+        The list is shared with the index, so callers should not modify it.
         Attaches the chunk to the hits if it is not attached already.
+        The h5 file is only opened if a chunk needs to be attached.
         """
-        self.populate_h5_file()
-
-        # Find the hits that are in this chunk
-        chunk_begin = self.h5_file.chunk_size * coarse_channel
-        chunk_end = chunk_begin + self.h5_file.chunk_size
-        hits = [h for h in self.hits if h.coarse_channel == coarse_channel]
+        self.populate_hits_by_coarse_channel()
+        hits = self.hits_by_coarse_channel.get(coarse_channel, [])
         if not attach_chunk or all(hit.data for hit in hits):
             return hits
 
+        self.populate_h5_file()
         chunk = self.h5_file.get_chunk(coarse_channel)
         for hit in hits:
             hit.attach_chunk(chunk)
@@ -199,7 +238,14 @@ class HitMap(object):
     def __repr__(self):
         plain = self.to_plain()
         return json.dumps(plain, indent=2)
-        
+
+
+def existing_hit_map_filenames(h5_filenames):
+    """
+    Returns the set of hitmap filenames that already exist for these h5 files.
+    """
+    return existing_filenames(make_hit_map_filename(f) for f in h5_filenames)
+
 
 if __name__ == "__main__":
     fname = sys.argv[1]
@@ -10,9 +10,9 @@ from matplotlib import pyplot as plt
 from IPython.display import display, Image
 import random
 
+from detect_cadences import read_cadences
 import h5_file
 import hit_info
-import json
 from plot_event import make_event_plot
 import scanner
 
@@ -134,9 +134,7 @@ def compare(seed=None, n=10):
     
 def load_cadences():
     answer = []
-    for line in open("/home/obs/cadences.json"):
-        info = json.loads(line)
-        filenames = info["filenames"]
+    for filenames in read_cadences("/home/obs/cadences.json"):
         dirs = [f.split("/")[-2] for f in filenames]
         if min(dirs) != max(dirs):
             continue
@@ -19,14 +19,17 @@ def readable_frequency_range(low, high):
             return candidate_string
     raise RuntimeError("control should not reach here")
 
-def make_event_plot(event, maybe_reuse_chunks=None):
+def make_event_plot(event, maybe_reuse_chunks=None, fig=None):
     """
     Uses pyplot to draw a plot for this event.
     It does not show or save the figure so callers can pick what they want to do with it.
     The figure is left "open" so the caller should call plt.close() when it's done.
+    Returns the figure.
 
     For efficiency, you can pass the chunks if they are already loaded, in maybe_reuse_chunks.
     This function will safely ignore them if they are the wrong chunks.
+    Similarly, you can pass a figure in fig to draw on. If it already has the right axes from a previous plot, they
+    are cleared and reused rather than being built again.
     """
     first_freq, last_freq = event.frequency_range()
     start_times = event.start_times()
@@ -36,7 +39,17 @@ def make_event_plot(event, maybe_reuse_chunks=None):
     event.populate_chunks()
     first_column = event.first_column()
     last_column = event.last_column()
-    fig, axs = plt.subplots(nrows=len(event.chunks), figsize=(80, 20))
+    nrows = len(event.chunks)
+    if fig is None:
+        fig = plt.figure()
+    if len(fig.axes) == nrows:
+        axs = fig.axes
+        for ax in axs:
+            ax.clear()
+    else:
+        fig.clear()
+        fig.set_size_inches(80, 20)
+        axs = fig.subplots(nrows=nrows, squeeze=False)[:, 0]
     for i, (ax, chunk, start_time) in enumerate(zip(axs, event.chunks, start_times)):
         region = chunk.display_region(first_column, last_column)
         ax.imshow(region, rasterized=True, interpolation="nearest", cmap="viridis")
@@ -56,14 +69,22 @@ def make_event_plot(event, maybe_reuse_chunks=None):
             ax.set_title(title, size=24, pad=24)
             
             
-    plt.subplots_adjust(hspace=0)
+    fig.subplots_adjust(hspace=0)
+    return fig
 
 
-def save_event_plot(event, maybe_reuse_chunks=None):
+def save_event_plot(event, maybe_reuse_chunks=None, fig=None):
+    """
+    If fig is provided, the plot is drawn on it and it is left open, so that it can be reused for the next plot.
+    Otherwise a new figure is created and closed after saving.
+    """
     plot_filename = event.plot_filename()
     dirname = os.path.dirname(plot_filename)
     Path(dirname).mkdir(parents=True, exist_ok=True)
-    make_event_plot(event, maybe_reuse_chunks=maybe_reuse_chunks)
-    plt.savefig(plot_filename, bbox_inches="tight")
+    owns_figure = fig is None
+    fig = make_event_plot(event, maybe_reuse_chunks=maybe_reuse_chunks, fig=fig)
+    fig.savefig(plot_filename, bbox_inches="tight")
+    event.plot_exists = True
     print("saved plot to", plot_filename)
-    plt.close()
+    if owns_figure:
+        plt.close(fig)
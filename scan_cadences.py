@@ -5,12 +5,12 @@ Given a json file of cadence information, creates any hit maps that have not bee
 Usage: ./scan_cadences.py <cadencelist>.json
 """
 
-import json
 import os
 import sys
 
+from detect_cadences import read_cadences
 import scanner
-from hit_map import make_hit_map_filename
+from hit_map import existing_hit_map_filenames, make_hit_map_filename
 
 
 def iter_scan_cadences(cadence_file):
@@ -21,12 +21,16 @@ def iter_scan_cadences(cadence_file):
     if not cadence_file.endswith(".json"):
         cadence_file = os.path.join(cadence_file, "cadences.json")
 
-    for line in open(cadence_file):
-        info = json.loads(line.strip())
-        for h5_filename in info["filenames"]:
-            if os.path.exists(make_hit_map_filename(h5_filename)):
+    cadences = read_cadences(cadence_file)
+    existing = existing_hit_map_filenames(f for filenames in cadences for f in filenames)
+
+    for filenames in cadences:
+        for h5_filename in filenames:
+            hit_map_filename = make_hit_map_filename(h5_filename)
+            if hit_map_filename in existing:
                 continue
             scanner.scan(h5_filename)
+            existing.add(hit_map_filename)
             yield
     print("scan_cadences complete")
 
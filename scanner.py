@@ -4,6 +4,7 @@ A tool to analyze files of shape (16, 1, 67108864) or similarly short-but-very-w
 Reports which columns are "interesting".
 """
 
+from concurrent.futures import ThreadPoolExecutor
 import cp
 import json
 import os
@@ -25,7 +26,9 @@ def calculate_window_mean(array, window_size):
     sums = cp.empty_like(array, dtype="float64")
     cp.cumsum(array, axis=1, out=sums)
     sums[:, window_size:] -= sums[:, :-window_size]
-    return sums[:, window_size-1:] / window_size
+    means = sums[:, window_size-1:]
+    means /= window_size
+    return means
 
 
 def calculate_window_stats(array, window_size):
@@ -36,13 +39,16 @@ def calculate_window_stats(array, window_size):
     """
     assert window_size >= 2
     
+    # The arithmetic after the cumsums is done in place, since each temporary is as big as the whole chunk.
     # mean = E[X]
     mean = calculate_window_mean(array, window_size)
     # ex2 = E[X^2]
-    ex2 = calculate_window_mean(array * array, window_size)
-    # Variance = E[X^2] - E[X]^2
-    variance = ex2 - (mean * mean)
-    std_dev = cp.maximum(cp.sqrt(variance), 0.01)
+    ex2 = calculate_window_mean(cp.square(array), window_size)
+    # Variance = E[X^2] - E[X]^2, computed in the ex2 buffer
+    std_dev = ex2
+    std_dev -= cp.square(mean)
+    cp.sqrt(std_dev, out=std_dev)
+    cp.maximum(std_dev, 0.01, out=std_dev)
     return mean, std_dev
     
 
@@ -79,48 +85,33 @@ class WindowCalculator(object):
         self.window_size = window_size
         self.means, self.devs = calculate_window_stats(self.array, window_size)
 
-    def pixel_snr(self):        
+    def hit_mask(self, pixel_thresh, two_pixel_thresh):
         """
+        Returns a boolean mask of the pixels whose pixel snr is over pixel_thresh, or whose two-pixel snr is over
+        two_pixel_thresh.
         pixel snr is the signal of a particular pixel, compared to the "noise" as defined by
         a window either to the left or the right of the pixel.
         snr is the number of standard deviations from the mean it would be, using the noise population
         to define mean and standard deviation.
-        The snr of a pixel is the higher of its left and right snr.
-        """
-        # left_snr is the snr calculated with noise using a window to the left
-        left_snr = cp.zeros_like(self.array)
-        left_snr[:, self.window_size:] = (self.array[:, self.window_size:] - self.means[:, :-1]) / self.devs[:, :-1]
-
-        # right_snr is the snr calculated with noise using a window to the right
-        right_snr = cp.zeros_like(self.array)
-        right_snr[:, :-self.window_size] = (self.array[:, :-self.window_size] - self.means[:, 1:]) / self.devs[:, 1:]
-
-        output = cp.maximum(left_snr, right_snr)
-        return output
-
-    def two_pixel_snr(self):
-        """
         two-pixel snr is like pixel snr, except we calculate the signal as the average over two consecutive pixels.
+        Each snr is only compared against its threshold, rather than kept around as a full float array.
         """
-        # First, in spot i we calculate signal for the pixel pair indexed with (i, i+1).
-        # signal is thus one column shorter than array.
-        signal = (self.array[:, :-1] + self.array[:, 1:]) / 2
+        means, devs, w = self.means, self.devs, self.window_size
+        mask = cp.zeros(self.array.shape, dtype=bool)
 
-        # left_snr is the snr for the pixel pair indexed with (i, i+1) calculated with a noise window to the left.
-        # thus the first window_size columns, and the last column, are zeros.
-        left_snr = cp.zeros_like(self.array)
-        left_snr[:, self.window_size:-1] = (signal[:, self.window_size:] - self.means[:, :-2]) / self.devs[:, :-2]
+        # Pixel snr, with the noise window to the left and then to the right
+        mask[:, w:] |= (self.array[:, w:] - means[:, :-1]) / devs[:, :-1] > pixel_thresh
+        mask[:, :-w] |= (self.array[:, :-w] - means[:, 1:]) / devs[:, 1:] > pixel_thresh
 
-        # right_snr is the snr for the pixel pair indexed with (i, i+1) calculated with a noise window to the right.
-        # thus the last (window_size+1) columns are zeros.
-        right_snr = cp.zeros_like(self.array)
-        right_snr[:, :-(self.window_size+1)] = (signal[:, :-self.window_size] - self.means[:, 2:]) / self.devs[:, 2:]
-
-        # Each pixel has four ways to get its best score: as the left or right member of the pair, and with a left or
-        # right window.
-        output = cp.maximum(left_snr, right_snr)
-        cp.maximum(output[:, :-1], output[:, 1:], out=output[:, 1:])
-        return output
+        # Two-pixel snr. Spot i is for the pair (i, i+1), which counts for both of its pixels.
+        # Each pixel has four ways to pass: as the left or right member of the pair, and with a left or right window.
+        signal = (self.array[:, :-1] + self.array[:, 1:]) / 2
+        pair_mask = cp.zeros(self.array.shape, dtype=bool)
+        pair_mask[:, w:-1] |= (signal[:, w:] - means[:, :-2]) / devs[:, :-2] > two_pixel_thresh
+        pair_mask[:, :-(w+1)] |= (signal[:, :-w] - means[:, 2:]) / devs[:, 2:] > two_pixel_thresh
+        mask |= pair_mask
+        mask[:, 1:] |= pair_mask[:, :-1]
+        return mask
 
     
 def find_hit_windows(mask):
@@ -131,21 +122,17 @@ def find_hit_windows(mask):
       array[row, first_column : (last_column + 1)]
     mask is a boolean array of which spots to count as a hit.
     """
-    rows, cols = cp.where(mask)
-
-    # Group pixel hits into adjacent sequences
-    hit_windows = []
-    for row, col in sorted(zip(map(int, rows), map(int, cols))):
-        if hit_windows:
-            prev_row, prev_first_column, prev_last_column = hit_windows[-1]
-            if prev_row == row and prev_last_column + 1 == col:
-                # This pixel is an extension of the previous hit
-                hit_windows[-1] = (prev_row, prev_first_column, col)
-                continue
-        # This pixel is the start of its own hit
-        hit_windows.append((row, col, col))
+    # Runs of hit pixels start where the row steps from 0 to 1 and end where it steps from 1 to 0.
+    # Padding each row with zeros makes sure every run has both a start and an end.
+    rows, columns = mask.shape
+    padded = cp.zeros((rows, columns + 2), dtype=cp.int8)
+    padded[:, 1:-1] = mask
+    steps = cp.diff(padded, axis=1)
 
-    return hit_windows
+    # cp.where returns indices in row-major order, so the starts and ends of the runs line up
+    start_rows, start_columns = cp.where(steps == 1)
+    _, end_columns = cp.where(steps == -1)
+    return list(zip(start_rows.tolist(), start_columns.tolist(), (end_columns - 1).tolist()))
 
 
 def find_hits(coarse_channel, chunk, experiment=False):
@@ -153,8 +140,6 @@ def find_hits(coarse_channel, chunk, experiment=False):
     Returns a list of HitInfo objects.
     """
     calc = WindowCalculator(chunk, 30)
-    pixel_snr = calc.pixel_snr()
-    two_pixel_snr = calc.two_pixel_snr()
 
     pixel_thresh = 6
     two_pixel_thresh = 4
@@ -162,7 +147,7 @@ def find_hits(coarse_channel, chunk, experiment=False):
     if experiment:
         pixel_thresh = 7
         
-    mask = (pixel_snr > pixel_thresh) | (two_pixel_snr > two_pixel_thresh)
+    mask = calc.hit_mask(pixel_thresh, two_pixel_thresh)
 
     hit_windows = find_hit_windows(mask)            
     hits = group_hit_windows(hit_windows, coarse_channel, chunk)
@@ -178,9 +163,13 @@ class Scanner(object):
     def num_chunks(self):
         return self.h5_file.num_chunks
         
-    def scan_chunk(self, i):
+    def scan_chunk(self, i, chunk=None):
+        """
+        chunk can be passed in if it has already been loaded.
+        """
         start_time = time.time()
-        chunk = self.h5_file.get_chunk(i)
+        if chunk is None:
+            chunk = self.h5_file.get_chunk(i)
         mid_time = time.time()
         hits = find_hits(i, chunk)
         for hit in hits:
@@ -192,8 +181,16 @@ class Scanner(object):
         print(f"scanned chunk {i} in {elapsed:.1f}s, GPU mem {gb:.2f}G, finding {len(hits)} hits", flush=True)
         
     def scan_all(self):
-        for i in range(self.num_chunks()):
-            self.scan_chunk(i)
+        # The next chunk is read and decompressed in the background while the current one is scanned.
+        # This keeps two chunks in memory at once.
+        num_chunks = self.num_chunks()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = executor.submit(self.h5_file.get_chunk, 0)
+            for i in range(num_chunks):
+                chunk = pending.result()
+                if i + 1 < num_chunks:
+                    pending = executor.submit(self.h5_file.get_chunk, i + 1)
+                self.scan_chunk(i, chunk=chunk)
 
     def save(self):
         out = self.hitmap.save()
@@ -42,7 +42,7 @@ def img_src(filename):
 def load_events(session, machine):
     filename = f"{EVENT_ROOT}/{session}/{machine}.events"
     events = [e for e in Event.load_list(filename)]
-    events.sort(key=lambda e: -e.score())
+    events.sort(key=Event.score, reverse=True)
     return events
 
 